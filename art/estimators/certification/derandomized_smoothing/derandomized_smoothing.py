@@ -107,6 +107,7 @@ class DeRandomizedSmoothingMixin(ABC):
             columns_in_data = x.shape[-2]
             rows_in_data = x.shape[-3]
 
+        # the ablators write into a new channel extended array, so x does not need to be copied per ablation
         if self.ablation_type in {"column", "row"}:
             if self.ablation_type == "column":
                 ablate_over_range = columns_in_data
@@ -115,7 +116,7 @@ class DeRandomizedSmoothingMixin(ABC):
                 ablate_over_range = rows_in_data
 
             for ablation_start in range(ablate_over_range):
-                ablated_x = self.ablator.forward(np.copy(x), column_pos=ablation_start)
+                ablated_x = self.ablator.forward(x, column_pos=ablation_start)
                 if ablation_start == 0:
                     preds = self._predict_classifier(
                         ablated_x, batch_size=batch_size, training_mode=training_mode, **kwargs
@@ -127,7 +128,7 @@ class DeRandomizedSmoothingMixin(ABC):
         elif self.ablation_type == "block":
             for xcorner in range(rows_in_data):
                 for ycorner in range(columns_in_data):
-                    ablated_x = self.ablator.forward(np.copy(x), row_pos=xcorner, column_pos=ycorner)
+                    ablated_x = self.ablator.forward(x, row_pos=xcorner, column_pos=ycorner)
                     if ycorner == 0 and xcorner == 0:
                         preds = self._predict_classifier(
                             ablated_x, batch_size=batch_size, training_mode=training_mode, **kwargs
@@ -194,6 +195,35 @@ class BaseAblator(ABC):
         """
         raise NotImplementedError
 
+    @staticmethod
+    def _extend_channels(x: np.ndarray) -> np.ndarray:
+        """
+        Channel extends the data with its complement so that a model can tell if a position is ablated. Both halves
+        are written into a single pre-allocated array rather than concatenating x with a temporary copy of 1 - x.
+
+        :param x: input batch in channels first format.
+        :return: Batch of shape (N, 2C, H, W) holding x followed by 1 - x along the channel axis.
+        """
+        num_channels = x.shape[1]
+        x_extended = np.empty((x.shape[0], 2 * num_channels) + x.shape[2:], dtype=np.result_type(x, 1.0))
+        x_extended[:, :num_channels] = x
+        np.subtract(1.0, x, out=x_extended[:, num_channels:])
+        return x_extended
+
+    @staticmethod
+    def _retained_mask(positions: list, ablation_size: int, length: int) -> np.ndarray:
+        """
+        Builds the mask of the retained positions along one image axis for a different start position per sample,
+        wrapping around the end of the axis in the same way as the ablate methods.
+
+        :param positions: start of the retained region for each sample in the batch.
+        :param ablation_size: size of the retained region.
+        :param length: number of rows or columns along the image axis.
+        :return: Boolean array of shape (len(positions), length) which is True where the data is retained.
+        """
+        offsets = (np.arange(length)[np.newaxis, :] - np.asarray(positions)[:, np.newaxis]) % length
+        return offsets < ablation_size
+
 
 class ColumnAblator(BaseAblator):
     """
@@ -240,7 +270,7 @@ class ColumnAblator(BaseAblator):
         :return: Array of bools indicating if a point is certified against the given patch dimensions.
         """
         indices = np.argsort(-preds, axis=1, kind="stable")
-        values = np.take_along_axis(np.copy(preds), indices, axis=1)
+        values = np.take_along_axis(preds, indices, axis=1)
 
         num_affected_classifications = size_to_certify + self.ablation_size - 1
 
@@ -297,15 +327,19 @@ class ColumnAblator(BaseAblator):
         if not self.channels_first:
             x = np.transpose(x, (0, 3, 1, 2))
 
-        x = np.concatenate([x, 1.0 - x], axis=1)
+        x = self._extend_channels(x)
 
         if column_pos is None:
             column_pos = random.randint(0, x.shape[3])
 
         if isinstance(column_pos, list):
             assert len(column_pos) == len(x)
-            for i, pos in enumerate(column_pos):
-                x[i : i + 1] = self.ablate(x[i : i + 1], pos)
+            # ablate all samples at once by broadcasting a per-sample mask over the channels and the other image axis
+            if self.row_ablation_mode:
+                mask = self._retained_mask(column_pos, self.ablation_size, x.shape[2])[:, np.newaxis, :, np.newaxis]
+            else:
+                mask = self._retained_mask(column_pos, self.ablation_size, x.shape[3])[:, np.newaxis, np.newaxis, :]
+            np.copyto(x, 0.0, where=~mask)
         else:
             x = self.ablate(x, column_pos)
 
@@ -358,7 +392,7 @@ class BlockAblator(BaseAblator):
         :return: Array of bools indicating if a point is certified against the given patch dimensions.
         """
         indices = np.argsort(-preds, axis=1, kind="stable")
-        values = np.take_along_axis(np.copy(preds), indices, axis=1)
+        values = np.take_along_axis(preds, indices, axis=1)
         margin = values[:, 0] - values[:, 1]
 
         num_affected_classifications = (size_to_certify + self.ablation_size - 1) ** 2
@@ -393,11 +427,14 @@ class BlockAblator(BaseAblator):
         if column_pos is None:
             column_pos = random.randint(0, x.shape[3])
 
-        x = np.concatenate([x, 1.0 - x], axis=1)
+        x = self._extend_channels(x)
 
         if isinstance(row_pos, list) and isinstance(column_pos, list):
-            for i, (row, col) in enumerate(zip(row_pos, column_pos)):
-                x[i : i + 1] = self.ablate(x[i : i + 1], row_pos=row, column_pos=col)
+            # ablate all samples at once by broadcasting the outer product of the per-sample row and column masks
+            row_mask = self._retained_mask(row_pos, self.ablation_size, x.shape[2])
+            column_mask = self._retained_mask(column_pos, self.ablation_size, x.shape[3])
+            mask = (row_mask[:, :, np.newaxis] & column_mask[:, np.newaxis, :])[:, np.newaxis]
+            np.copyto(x, 0.0, where=~mask)
         elif isinstance(row_pos, int) and isinstance(column_pos, int):
             x = self.ablate(x, row_pos=row_pos, column_pos=column_pos)
 
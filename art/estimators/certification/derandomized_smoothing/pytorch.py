@@ -67,6 +67,9 @@ class PyTorchDeRandomizedSmoothing(DeRandomizedSmoothingMixin, PyTorchClassifier
         threshold: float,
         logits: bool,
         optimizer: Optional["torch.optim.Optimizer"] = None,  # type: ignore
+        use_amp: bool = False,
+        opt_level: str = "O1",
+        loss_scale: Optional[Union[float, str]] = "dynamic",
         channels_first: bool = True,
         clip_values: Optional["CLIP_VALUES_TYPE"] = None,
         preprocessing_defences: Union["Preprocessor", List["Preprocessor"], None] = None,
@@ -89,6 +92,13 @@ class PyTorchDeRandomizedSmoothing(DeRandomizedSmoothingMixin, PyTorchClassifier
         :param threshold: The minimum threshold to count a prediction.
         :param logits: if the model returns logits or normalized probabilities
         :param optimizer: The optimizer used to train the classifier.
+        :param use_amp: Whether to use the automatic mixed precision tool to enable mixed precision training or
+                        gradient computation, e.g. with loss gradient computation. When set to True, this option is
+                        only triggered if there are GPUs available.
+        :param opt_level: Specify a pure or mixed precision optimization level. Used when use_amp is True. Accepted
+                          values are `O0`, `O1`, `O2`, and `O3`.
+        :param loss_scale: Loss scaling. Used when use_amp is True. If passed as a string, must be a string
+                           representing a number, e.g., “1.0”, or the string “dynamic”.
         :param channels_first: Set channels first or last.
         :param clip_values: Tuple of the form `(min, max)` of floats or `np.ndarray` representing the minimum and
                maximum values allowed for features. If floats are provided, these will be used as the range of all
@@ -107,6 +117,9 @@ class PyTorchDeRandomizedSmoothing(DeRandomizedSmoothingMixin, PyTorchClassifier
             input_shape=input_shape,
             nb_classes=nb_classes,
             optimizer=optimizer,
+            use_amp=use_amp,
+            opt_level=opt_level,
+            loss_scale=loss_scale,
             channels_first=channels_first,
             clip_values=clip_values,
             preprocessing_defences=preprocessing_defences,
@@ -122,8 +135,11 @@ class PyTorchDeRandomizedSmoothing(DeRandomizedSmoothingMixin, PyTorchClassifier
     def _predict_classifier(self, x: np.ndarray, batch_size: int, training_mode: bool, **kwargs) -> np.ndarray:
         import torch
 
-        x = x.astype(ART_NUMPY_DTYPE)
-        outputs = PyTorchClassifier.predict(self, x=x, batch_size=batch_size, training_mode=training_mode, **kwargs)
+        # the ablated input is already a fresh array, avoid a second copy when it is already of the right dtype
+        x = x.astype(ART_NUMPY_DTYPE, copy=False)
+        # the predictions over the ablations are only ever counted, so also skip view and version tracking
+        with torch.inference_mode():
+            outputs = PyTorchClassifier.predict(self, x=x, batch_size=batch_size, training_mode=training_mode, **kwargs)
 
         if not self.logits:
             return np.asarray((outputs >= self.threshold))
@@ -204,7 +220,7 @@ class PyTorchDeRandomizedSmoothing(DeRandomizedSmoothingMixin, PyTorchClassifier
 
             # Train for one epoch
             for m in range(num_batch):
-                i_batch = np.copy(x_preprocessed[ind[m * batch_size : (m + 1) * batch_size]])
+                i_batch = x_preprocessed[ind[m * batch_size : (m + 1) * batch_size]]
                 i_batch = self.ablator.forward(i_batch)
 
                 i_batch = torch.from_numpy(i_batch).to(self._device)
@@ -15,6 +15,7 @@
 # AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import gc
 import importlib
 import json
 import logging
@@ -202,6 +203,14 @@ def setup_tear_down_framework(framework):
 
         keras.backend.clear_session()
 
+    if framework == "pytorch":
+        import torch
+
+        if torch.cuda.is_available():
+            # release the models of the finished test from the caching allocator before the next test builds its own
+            gc.collect()
+            torch.cuda.empty_cache()
+
 
 @pytest.fixture
 def image_iterator(framework, get_default_mnist_subset, default_batch_size):